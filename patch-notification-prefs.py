@@ -1,152 +1,215 @@
 #!/usr/bin/env python3
 """
 Notification Preferences Patch Script
-Run this on the server: python3 patch-notification-prefs.py
+Run this on the server: python3 patch-notification-prefs.py [--quiet]
+Needs patch_common.py and templates/ next to it (the app root).
 """
 
+import atexit
 import re
 import os
+import sys
+
+from patch_common import copy_owner_mode, map_file, template_text
+
+def _file_contains(path, needle):
+    with open(path, 'rb') as f, map_file(f) as mm:
+        return mm.find(needle) >= 0
+
+def _write_atomic(path, text):
+    # Temp file + rename so a crash never leaves the target truncated; the
+    # encoded buffer goes out with vectored writes on a raw fd (no BufferedWriter)
+    data = memoryview(text.encode('utf-8'))
+    tmp = path + '.tmp'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        while data:
+            data = data[os.writev(fd, [data]):]
+    finally:
+        os.close(fd)
+    copy_owner_mode(path, tmp)
+    os.replace(tmp, path)
+
+# Status lines are collected and written once at exit (skipped with --quiet)
+QUIET = '--quiet' in sys.argv[1:]
+log = []
+
+@atexit.register
+def _flush_log():
+    if log and not QUIET:
+        sys.stdout.write('\n'.join(log) + '\n')
 
 os.chdir('/var/www/scoutloot/app')
 
+# Probe the raw files first so a rerun doesn't read, back up and rewrite them
+html_done = _file_contains('public/index.html', b'settings-weekly-digest')
+users_done = _file_contains('src/routes/users.ts', b'weekly_digest_enabled')
+
+if html_done and users_done:
+    log.append("✅ Notification preferences already patched - nothing to do")
+    sys.exit(0)
+
 # ==============================================
 # PART 1: Patch public/index.html
 # ==============================================
 
-print("=" * 50)
-print("Patching public/index.html...")
-print("=" * 50)
-
-with open('public/index.html', 'r', encoding='utf-8') as f:
-    html = f.read()
+log.append("=" * 50)
+log.append("Patching public/index.html...")
+log.append("=" * 50)
 
-# Backup
-with open('public/index.html.bak.notifprefs', 'w', encoding='utf-8') as f:
-    f.write(html)
-print("✅ Backup created: public/index.html.bak.notifprefs")
-
-# 1. Add notification preferences UI section before Save Settings button
-# Look for the save button in settings modal
-notification_ui = '''<div class="form-divider">Notifications</div>
-        
-        <div class="form-group">
-          <label style="display: flex; align-items: center; gap: 12px; cursor: pointer; padding: 8px 0;">
-            <input type="checkbox" id="settings-weekly-digest" checked style="width: 20px; height: 20px; accent-color: var(--accent);">
-            <span style="color: var(--text-secondary);">
-              📊 <strong>Weekly Digest</strong> — Sunday summary of all your watches
-            </span>
-          </label>
-        </div>
-        
-        <div class="form-group">
-          <label style="display: flex; align-items: center; gap: 12px; cursor: pointer; padding: 8px 0;">
-            <input type="checkbox" id="settings-still-available" style="width: 20px; height: 20px; accent-color: var(--accent);">
-            <span style="color: var(--text-secondary);">
-              💡 <strong>"Still Available" Reminders</strong> — Notify after 3 days if deal &gt;20% off is still there
-            </span>
-          </label>
-        </div>
-        
-        '''
-
-# Find the save settings button and insert before it
-save_button_pattern = r'(<div style="margin-top: 24px;">\s*<button type="submit" class="btn btn-primary"[^>]*>Save Settings</button>\s*</div>\s*</form>\s*</div>\s*</div>\s*\n\s*<!-- Toast)'
-
-if re.search(save_button_pattern, html):
-    html = re.sub(
-        save_button_pattern,
-        notification_ui + r'\1',
-        html
-    )
-    print("✅ Added notification preferences UI")
+if html_done:
+    log.append("✅ index.html already has notification preferences UI")
 else:
-    # Try simpler pattern
-    if '<button type="submit" class="btn btn-primary" style="width: 100%;">Save Settings</button>' in html:
-        html = html.replace(
-            '<div style="margin-top: 24px;">\n          <button type="submit" class="btn btn-primary" style="width: 100%;">Save Settings</button>\n        </div>\n      </form>',
-            notification_ui + '<div style="margin-top: 24px;">\n          <button type="submit" class="btn btn-primary" style="width: 100%;">Save Settings</button>\n        </div>\n      </form>'
-        )
-        print("✅ Added notification preferences UI (alt pattern)")
-    else:
-        print("⚠️  Could not find save button pattern - adding after Telegram section")
-        # Find form-divider Telegram and add after the telegram section
-        html = html.replace(
-            '<div class="form-divider">Telegram</div>',
-            '<div class="form-divider">Telegram</div>'
-        )
-
-# 2. Update handleSettings to save new preferences
-old_settings_body = 'ship_to_country: country,\n          timezone: timezone,'
-new_settings_body = '''ship_to_country: country,
+    # Load the template first so a missing templates/ changes nothing
+    notification_ui = template_text('notification_ui.html')
+
+    # Read once; the backup is written from the same buffer
+    with open('public/index.html', 'rb') as f:
+        original = f.read()
+
+    # Backup
+    with open('public/index.html.bak.notifprefs', 'wb') as f:
+        f.write(original)
+    log.append("✅ Backup created: public/index.html.bak.notifprefs")
+
+    html = original.decode('utf-8')
+
+    # 1. Add notification preferences UI section before Save Settings button
+    # Look for the save button in settings modal (notification_ui, loaded above)
+
+    # Find the save settings button and insert before it
+    # Possessive quantifiers (stdlib re, Python 3.11+) never backtrack into the
+    # whitespace/attribute runs; the run before the required \n stays greedy.
+    save_button_pattern = r'<div style="margin-top: 24px;">\s*+<button type="submit" class="btn btn-primary"[^>]*+>Save Settings</button>\s*+</div>\s*+</form>\s*+</div>\s*+</div>\s*\n\s*+<!-- Toast'
+    if sys.version_info < (3, 11):
+        save_button_pattern = save_button_pattern.replace('*+', '*')
+
+    # 2. Update handleSettings to save new preferences
+    # Read each checkbox once next to the other form values, then reference the locals in the body
+    old_settings_vars = "const country = document.getElementById('settings-country').value;"
+    new_settings_vars = """const country = document.getElementById('settings-country').value;
+      const weeklyDigest = document.getElementById('settings-weekly-digest')?.checked;
+      const reminders = document.getElementById('settings-still-available')?.checked;"""
+    old_settings_body = 'ship_to_country: country,\n          timezone: timezone,'
+    new_settings_body = '''ship_to_country: country,
           timezone: timezone,
-          weekly_digest_enabled: document.getElementById('settings-weekly-digest').checked,
-          still_available_reminders: document.getElementById('settings-still-available').checked,'''
+          weekly_digest_enabled: weeklyDigest,
+          still_available_reminders: reminders,'''
 
-if old_settings_body in html:
-    html = html.replace(old_settings_body, new_settings_body)
-    print("✅ Updated handleSettings to save preferences")
-else:
-    print("⚠️  Could not find handleSettings body pattern")
-
-# 3. Update settings loading (openModal or similar)
-# Find where settings-country is populated
-old_load = "document.getElementById('settings-country').value = state.user.ship_to_country;"
-new_load = """document.getElementById('settings-country').value = state.user.ship_to_country;
+    # 3. Update settings loading (openModal or similar)
+    # Find where settings-country is populated
+    old_load = "document.getElementById('settings-country').value = state.user.ship_to_country;"
+    new_load = """document.getElementById('settings-country').value = state.user.ship_to_country;
           document.getElementById('settings-weekly-digest').checked = state.user.weekly_digest_enabled ?? true;
           document.getElementById('settings-still-available').checked = state.user.still_available_reminders ?? false;"""
 
-if old_load in html:
-    html = html.replace(old_load, new_load)
-    print("✅ Updated settings loading to populate checkboxes")
-else:
-    print("⚠️  Could not find settings load pattern")
+    # The declarations and the body edit are one unit: a single match runs from
+    # the declaration to the body without crossing into another function, so
+    # the locals are only added where the body that uses them is rewritten
+    settings_pattern = re.escape(old_settings_vars) + r'(?s:(?:(?!\bfunction\b).)*?)' + re.escape(old_settings_body)
+
+    def patch_settings(m):
+        between = m.group()[len(old_settings_vars):-len(old_settings_body)]
+        return new_settings_vars + between + new_settings_body
+
+    # Apply all edits in a single pass over the HTML
+    html_edits = [
+        (save_button_pattern, lambda m: notification_ui + m.group()),
+        (settings_pattern, patch_settings),
+        (re.escape(old_load), new_load),
+    ]
+    html_edit_re = re.compile('|'.join(f'(?P<e{i}>{pattern})' for i, (pattern, _) in enumerate(html_edits)))
+    html_hits = set()
+
+    def apply_html_edit(m):
+        i = int(m.lastgroup[1:])
+        html_hits.add(i)
+        repl = html_edits[i][1]
+        return repl(m) if callable(repl) else repl
+
+    html = html_edit_re.sub(apply_html_edit, html)
+
+    if 0 in html_hits:
+        log.append("✅ Added notification preferences UI")
+    else:
+        # Try simpler pattern
+        # (str.replace returns the same object when nothing matched)
+        patched = html.replace(
+            '<div style="margin-top: 24px;">\n          <button type="submit" class="btn btn-primary" style="width: 100%;">Save Settings</button>\n        </div>\n      </form>',
+            notification_ui + '<div style="margin-top: 24px;">\n          <button type="submit" class="btn btn-primary" style="width: 100%;">Save Settings</button>\n        </div>\n      </form>',
+            1
+        )
+        if patched is not html:
+            html = patched
+            log.append("✅ Added notification preferences UI (alt pattern)")
+        else:
+            log.append("⚠️  Could not find save button pattern - adding after Telegram section")
+            # Find form-divider Telegram and add after the telegram section
+            html = html.replace(
+                '<div class="form-divider">Telegram</div>',
+                '<div class="form-divider">Telegram</div>'
+            )
 
-with open('public/index.html', 'w', encoding='utf-8') as f:
-    f.write(html)
+    if 1 in html_hits:
+        log.append("✅ Updated handleSettings to save preferences")
+    else:
+        log.append("⚠️  Could not find handleSettings body pattern")
+
+    if 2 in html_hits:
+        log.append("✅ Updated settings loading to populate checkboxes")
+    else:
+        log.append("⚠️  Could not find settings load pattern")
 
-print("✅ Saved public/index.html")
+    _write_atomic('public/index.html', html)
+
+    log.append("✅ Saved public/index.html")
 
 # ==============================================
 # PART 2: Patch src/routes/users.ts
 # ==============================================
 
-print("\n" + "=" * 50)
-print("Patching src/routes/users.ts...")
-print("=" * 50)
-
-with open('src/routes/users.ts', 'r', encoding='utf-8') as f:
-    users_ts = f.read()
-
-# Backup
-with open('src/routes/users.ts.bak.notifprefs', 'w', encoding='utf-8') as f:
-    f.write(users_ts)
-print("✅ Backup created: src/routes/users.ts.bak.notifprefs")
+log.append("\n" + "=" * 50)
+log.append("Patching src/routes/users.ts...")
+log.append("=" * 50)
 
 # Check if there's already a PATCH /:id route that handles settings
-if 'weekly_digest_enabled' in users_ts:
-    print("✅ users.ts already has notification preferences support")
+if users_done:
+    log.append("✅ users.ts already has notification preferences support")
 else:
+    # Read once; the backup is written from the same buffer
+    with open('src/routes/users.ts', 'rb') as f:
+        original = f.read()
+
+    # Backup
+    with open('src/routes/users.ts.bak.notifprefs', 'wb') as f:
+        f.write(original)
+    log.append("✅ Backup created: src/routes/users.ts.bak.notifprefs")
+
+    users_ts = original.decode('utf-8')
+
     # We need to add or update the PATCH route
     # First check if there's a PATCH /:id route
     if "router.patch('/:id'," in users_ts:
-        print("Found existing PATCH /:id route - need to update it")
+        log.append("Found existing PATCH /:id route - need to update it")
         # This is complex - let's just add the fields to the destructuring and update query
         
         # Add to destructuring
         old_destructure = "const { ship_to_country, timezone } = req.body;"
         new_destructure = "const { ship_to_country, timezone, weekly_digest_enabled, still_available_reminders } = req.body;"
         
-        if old_destructure in users_ts:
-            users_ts = users_ts.replace(old_destructure, new_destructure)
+        patched = users_ts.replace(old_destructure, new_destructure, 1)
+        destructured = patched is not users_ts
+        users_ts = patched
         
         # Try another pattern
-        if "ship_to_country, timezone" in users_ts and "weekly_digest_enabled" not in users_ts:
+        if not destructured:
             users_ts = users_ts.replace(
                 "ship_to_country, timezone }",
-                "ship_to_country, timezone, weekly_digest_enabled, still_available_reminders }"
+                "ship_to_country, timezone, weekly_digest_enabled, still_available_reminders }",
+                1
             )
         
-        print("⚠️  Partial update - may need manual review")
+        log.append("⚠️  Partial update - may need manual review")
     else:
         # No PATCH /:id route - need to add one before export default
         new_route = '''
@@ -166,38 +229,32 @@ router.patch('/:id', async (req: Request, res: Response): Promise<void> => {
       still_available_reminders 
     } = req.body;
 
-    const updates: string[] = [];
-    const values: (string | boolean)[] = [];
-    let paramCount = 1;
-
-    if (ship_to_country !== undefined) {
-      updates.push(`ship_to_country = $${paramCount++}`);
-      values.push(ship_to_country);
-    }
-    if (timezone !== undefined) {
-      updates.push(`timezone = $${paramCount++}`);
-      values.push(timezone);
-    }
-    if (weekly_digest_enabled !== undefined) {
-      updates.push(`weekly_digest_enabled = $${paramCount++}`);
-      values.push(weekly_digest_enabled);
-    }
-    if (still_available_reminders !== undefined) {
-      updates.push(`still_available_reminders = $${paramCount++}`);
-      values.push(still_available_reminders);
-    }
-
-    if (updates.length === 0) {
+    // Check if there's anything to update
+    if (ship_to_country === undefined && 
+        timezone === undefined && 
+        weekly_digest_enabled === undefined && 
+        still_available_reminders === undefined) {
       res.status(400).json({ error: 'No fields to update' });
       return;
     }
 
-    updates.push('updated_at = NOW()');
-    values.push(id);
-
+    // Fixed SQL text (omitted fields keep their value) so the plan is reusable
     const result = await query(
-      `UPDATE users SET ${updates.join(', ')} WHERE id = $${paramCount} AND deleted_at IS NULL RETURNING *`,
-      values
+      `UPDATE users SET
+         ship_to_country = COALESCE($1, ship_to_country),
+         timezone = COALESCE($2, timezone),
+         weekly_digest_enabled = COALESCE($3, weekly_digest_enabled),
+         still_available_reminders = COALESCE($4, still_available_reminders),
+         updated_at = NOW()
+       WHERE id = $5 AND deleted_at IS NULL
+       RETURNING *`,
+      [
+        ship_to_country ?? null,
+        timezone ?? null,
+        weekly_digest_enabled ?? null,
+        still_available_reminders ?? null,
+        id,
+      ]
     );
 
     if (result.rows.length === 0) {
@@ -215,29 +272,30 @@ router.patch('/:id', async (req: Request, res: Response): Promise<void> => {
 
 '''
         # Insert before export default
-        if 'export default router;' in users_ts:
-            users_ts = users_ts.replace(
-                'export default router;',
-                new_route + 'export default router;'
-            )
-            print("✅ Added new PATCH /:id route")
+        patched = users_ts.replace(
+            'export default router;',
+            new_route + 'export default router;',
+            1
+        )
+        if patched is not users_ts:
+            users_ts = patched
+            log.append("✅ Added new PATCH /:id route")
         else:
-            print("⚠️  Could not find export default - adding at end")
+            log.append("⚠️  Could not find export default - adding at end")
             users_ts += new_route
 
-with open('src/routes/users.ts', 'w', encoding='utf-8') as f:
-    f.write(users_ts)
+    _write_atomic('src/routes/users.ts', users_ts)
 
-print("✅ Saved src/routes/users.ts")
+    log.append("✅ Saved src/routes/users.ts")
 
 # ==============================================
 # DONE
 # ==============================================
 
-print("\n" + "=" * 50)
-print("PATCH COMPLETE!")
-print("=" * 50)
-print("""
+log.append("\n" + "=" * 50)
+log.append("PATCH COMPLETE!")
+log.append("=" * 50)
+log.append("""
 Next steps:
 1. Build:  npx tsc
 2. Restart: pm2 restart all
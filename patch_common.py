@@ -0,0 +1,106 @@
+"""
+Helpers shared by the patch scripts in this directory.
+
+Scripts run from a subdirectory (public/, public/js/) put this directory on
+sys.path before importing it.
+"""
+
+import contextlib
+import functools
+import mmap
+import os
+import shutil
+from pathlib import Path
+
+@contextlib.contextmanager
+def map_file(f, access=mmap.ACCESS_READ):
+    """mmap the open file f, or yield b'' if it is empty.
+
+    mmap refuses to map a zero-length file, which is what a crash during an
+    old in-place write leaves behind; b'' answers find() the same way.
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        yield b''
+        return
+    with mmap.mmap(f.fileno(), 0, access=access) as mm:
+        yield mm
+
+def sendfile_copy(src, dst):
+    """Copy src to dst in-kernel with os.sendfile (no userspace buffers)"""
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        size = os.fstat(s.fileno()).st_size
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(d.fileno(), s.fileno(), offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+
+def copy_owner_mode(src, dst):
+    """Give dst the permission bits and, where allowed, the owner of src.
+
+    Used before renaming a temp file over src, so the replacement keeps the
+    original mode and ownership instead of the creating user's defaults.
+    """
+    shutil.copymode(src, dst)
+    st = os.stat(src)
+    try:
+        os.chown(dst, st.st_uid, st.st_gid)
+    except PermissionError:
+        # Only root can hand a file to another user; keep our own then
+        pass
+
+def patch_in_place(filepath, edits):
+    """Rewrite (offset, old_len, new_bytes) edits into filepath through an mmap.
+
+    The file is resized once and only the spans between edits are moved, so
+    neither the old nor the new contents are ever held in memory. Edits must
+    be sorted by offset and must not overlap.
+    """
+    if not edits:
+        return
+    with open(filepath, 'r+b') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # An empty file cannot be mapped; the only edits it can have
+            # are insertions at offset 0
+            f.writelines(new for _, _, new in edits)
+            return
+        with mmap.mmap(f.fileno(), 0) as mm:
+            old_size = len(mm)
+            # Final shift of each untouched span (the one following each edit)
+            spans = []
+            shift = 0
+            ends = [offset for offset, _, _ in edits[1:]] + [old_size]
+            for (offset, old_len, new), end in zip(edits, ends):
+                shift += len(new) - old_len
+                spans.append((offset + old_len, end, shift))
+            new_size = old_size + shift
+            if new_size > old_size:
+                mm.resize(new_size)
+            # Spans moving left go front to back, spans moving right back to
+            # front, so no span is overwritten before it has been moved
+            for start, end, d in spans:
+                if d < 0:
+                    mm.move(start + d, start, end - start)
+            for start, end, d in reversed(spans):
+                if d > 0:
+                    mm.move(start + d, start, end - start)
+            shift = 0
+            for offset, old_len, new in edits:
+                mm[offset + shift:offset + shift + len(new)] = new
+                shift += len(new) - old_len
+            if new_size < old_size:
+                mm.resize(new_size)
+
+# Large literal snippets live in templates/ (kept out of public/ so they are
+# never served) and are only read when a patch needs them
+TEMPLATES_DIR = Path(__file__).resolve().parent / 'templates'
+
+@functools.cache
+def template(name):
+    """Raw bytes of templates/<name>"""
+    return (TEMPLATES_DIR / name).read_bytes()
+
+def template_text(name):
+    """templates/<name> decoded as UTF-8"""
+    return template(name).decode('utf-8')
@@ -2,376 +2,280 @@
 """
 Patch script to add password reset functionality to ScoutLoot index.html
 Run: python3 patch_password_reset.py
+Needs patch_common.py and templates/ next to it (the app root).
 """
 
+import errno
+import os
 import re
 import shutil
 from pathlib import Path
 
+from patch_common import copy_owner_mode, map_file, template
+
 # Path to index.html
 INDEX_PATH = Path('/var/www/scoutloot/app/public/index.html')
 BACKUP_PATH = Path('/var/www/scoutloot/app/public/index.html.backup')
 
-def read_file(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return f.read()
+# Every insertion point is located in a single pass over the page: one
+# alternation of named landmarks, first match of each kept by find_landmarks()
+_LANDMARK_RE = re.compile(
+    rb'(?P<settings_end></div>\n  </div>\n  \n  <!-- Toast Container -->)'
+    rb'|(?P<toast><!-- Toast Container -->)'
+    rb'|(?P<utility>// ===========================================\s*// UTILITY FUNCTIONS\s*// ===========================================\s*\n\s*function scrollTo\(selector\) \{\s*document\.querySelector\(selector\)\?\.scrollIntoView\(\{ behavior: \'smooth\' \}\);\s*\})'
+    rb'|(?P<init_header>// ===========================================\n    // INITIALIZATION)'
+    rb'|(?P<init_try>try \{\n          const user = await apiCall\(`/users/\$\{savedUser\.id\}`\);\n          state\.user = user;\n          updateUI\(\);\n          showDashboard\(\);\n        \} catch \(error\) \{\n          // User no longer exists, clear storage\n          clearStorage\(\);\n        \}\n      \}\n    \})'
+    rb'|(?P<init_clear>clearStorage\(\);\s*\}\s*\}\s*\})'
+)
+
+TOAST = b'<!-- Toast Container -->'
+
+# Markers of an already-applied patch, all checked in one pass by find_markers()
+MARKERS = (b'modal-forgot-password', b'modal-reset-password',
+           b'handleForgotPassword', b'checkForResetToken()')
+_MARKER_RE = re.compile(b'|'.join(map(re.escape, MARKERS)))
+
+# Landmarks each patch can insert at (any one will do), keyed by the marker
+# of that patch; main() refuses to write a page where a patch still to be
+# applied has none of them
+REQUIRED_LANDMARKS = {
+    b'modal-forgot-password': ('settings_end', 'toast'),
+    b'modal-reset-password': ('toast',),
+    b'handleForgotPassword': ('utility', 'init_header'),
+}
+
+# Most buffers a single writev() call accepts
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+def _writev_all(fd, bufs):
+    # writev() the buffers until all of them are out; returns the byte count
+    written = 0
+    while bufs:
+        n = os.writev(fd, bufs)
+        written += n
+        while bufs and n >= len(bufs[0]):
+            n -= len(bufs.pop(0))
+        if n:
+            bufs[0] = bufs[0][n:]
+    return written
+
+def write_file(path, chunks):
+    # Gather-write the chunks into a sibling temp file on an unbuffered fd,
+    # fsync it and rename it over the target: the page is never left
+    # half-written, and a hardlinked backup keeps the old inode. Chunks are
+    # written in IOV_MAX batches as they come, so zero-copy views from
+    # splice() are never gathered into one buffer. Returns the number of
+    # bytes written
+    tmp = Path(f'{path}.tmp')
+    written = 0
+    with open(tmp, 'wb', buffering=0) as f:
+        bufs = []
+        for chunk in chunks:
+            if chunk:
+                bufs.append(memoryview(chunk))
+            if len(bufs) == IOV_MAX:
+                written += _writev_all(f.fileno(), bufs)
+        written += _writev_all(f.fileno(), bufs)
+        os.fsync(f.fileno())
+    copy_owner_mode(path, tmp)
+    os.replace(tmp, path)
+    return written
+
+def splice(content, edits):
+    """Yield content with (start, end, text) edits applied, in order.
+
+    Untouched spans are yielded as memoryview slices of content, so an mmap
+    is written out without copying it; the views are released once the
+    generator is exhausted.
+    """
+    # Stable sort keeps same-offset insertions in patch order
+    with memoryview(content) as view:
+        pos = 0
+        for start, end, text in sorted(edits, key=lambda e: e[0]):
+            yield view[pos:start]
+            yield text
+            pos = end
+        yield view[pos:]
+
+# os.link() failures that backup_file() answers with a copy
+_NO_LINK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK}
+
+def fast_copy(src, dst):
+    # In-kernel copy (a reflink on btrfs/XFS) where copy_file_range exists,
+    # otherwise a plain buffered copy. dst must be a fresh path: opening it
+    # truncates it, which would also empty src if the two were hardlinked
+    with open(src, 'rb') as s, open(dst, 'xb') as d:
+        try:
+            remaining = os.fstat(s.fileno()).st_size
+            while remaining > 0:
+                n = os.copy_file_range(s.fileno(), d.fileno(), remaining)
+                if n == 0:
+                    break
+                remaining -= n
+        except (AttributeError, OSError):
+            s.seek(0)
+            d.seek(0)
+            d.truncate()
+            shutil.copyfileobj(s, d, length=1 << 20)
+    shutil.copymode(src, dst)
+
+def backup_file(src, dst):
+    # A hardlink is enough since write_file() never rewrites src in place.
+    # An earlier run that stopped before writing leaves dst linked to src,
+    # which is already a backup of the current page
+    if dst.exists() and os.path.samefile(src, dst):
+        return
+    # Link (or copy, across filesystems) to a temp name and rename it over
+    # dst, so an existing backup is replaced and never truncated in place
+    tmp = Path(f'{dst}.tmp')
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+    except OSError as e:
+        # Copy across filesystems, or where hardlinks are not supported
+        if e.errno not in _NO_LINK_ERRNOS:
+            raise
+        fast_copy(src, tmp)
+    os.replace(tmp, dst)
+
+def find_landmarks(content):
+    """Scan content once; return {landmark name: (start, end)} of first matches"""
+    landmarks = {}
+    for m in _LANDMARK_RE.finditer(content):
+        landmarks.setdefault(m.lastgroup, m.span())
+    # The settings modal landmark swallows the toast comment that ends it
+    if 'settings_end' in landmarks and 'toast' not in landmarks:
+        end = landmarks['settings_end'][1]
+        landmarks['toast'] = (end - len(TOAST), end)
+    return landmarks
 
-def write_file(path, content):
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(content)
+def find_markers(content):
+    """Scan content once; return the set of MARKERS present"""
+    found = set()
+    for m in _MARKER_RE.finditer(content):
+        found.add(m.group())
+        if len(found) == len(MARKERS):
+            break
+    return found
 
-def patch_login_modal_forgot_link(content):
+def missing_landmarks(landmarks, markers):
+    """Return the markers of patches still to apply that have no landmark"""
+    return [marker for marker, names in REQUIRED_LANDMARKS.items()
+            if marker not in markers and not any(name in landmarks for name in names)]
+
+def patch_login_modal_forgot_link(content, landmarks, markers):
     """Add 'Forgot Password?' link to login modal"""
     
-    # Find the login form and add forgot password link after the password field
-    old_pattern = r'''(<div class="form-group">
-          <label for="login-password">Password</label>
-          <input type="password" id="login-password" placeholder="••••••••" required>
-        </div>)'''
-    
-    new_code = r'''\1
-        <div style="text-align: right; margin-bottom: 16px;">
-          <a href="#" onclick="switchModal('login', 'forgot-password'); return false;" style="font-size: 0.85rem; color: var(--accent); text-decoration: none;">Forgot password?</a>
-        </div>'''
-    
-    # Try exact match first
-    if old_pattern.replace('\n', '').replace(' ', '') in content.replace('\n', '').replace(' ', ''):
-        # Use more flexible regex
-        pattern = r'(<div class="form-group">\s*<label for="login-password">Password</label>\s*<input type="password" id="login-password"[^>]*>\s*</div>)'
-        content = re.sub(pattern, r'''\1
-        <div style="text-align: right; margin-bottom: 16px;">
-          <a href="#" onclick="switchModal('login', 'forgot-password'); return false;" style="font-size: 0.85rem; color: var(--accent); text-decoration: none;">Forgot password?</a>
-        </div>''', content)
-        print("✓ Added 'Forgot password?' link to login modal")
-    else:
-        print("⚠ Could not find login password field, trying alternative pattern...")
-        # Try alternative approach - find by login-password id
-        if 'id="login-password"' in content and 'Forgot password?' not in content:
-            # Insert after the password form-group closing div
-            pattern = r'(id="login-password"[^>]*>\s*</div>)'
-            replacement = r'''\1
+    forgot_link = b'''
         <div style="text-align: right; margin-bottom: 16px;">
           <a href="#" onclick="switchModal('login', 'forgot-password'); return false;" style="font-size: 0.85rem; color: var(--accent); text-decoration: none;">Forgot password?</a>
         </div>'''
-            content = re.sub(pattern, replacement, content)
-            print("✓ Added 'Forgot password?' link (alternative method)")
     
-    return content
+    # Find the login password input and add the link after its form-group
+    pos = content.find(b'id="login-password"')
+    if pos == -1:
+        print("✗ Could not find login password field")
+        return []
+    # An existing link sits right after the field, so only look nearby
+    if content.find(b'Forgot password?', pos, pos + 4096) != -1:
+        print("⚠ 'Forgot password?' link already exists, skipping...")
+        return []
+    end = content.find(b'</div>', pos)
+    if end == -1:
+        print("✗ Could not find end of login password field")
+        return []
+    end += len(b'</div>')
+    print("✓ Added 'Forgot password?' link to login modal")
+    
+    return [(end, end, forgot_link)]
 
-def add_forgot_password_modal(content):
+def add_forgot_password_modal(content, landmarks, markers):
     """Add the Forgot Password modal after the Settings modal"""
     
-    if 'modal-forgot-password' in content:
+    if b'modal-forgot-password' in markers:
         print("⚠ Forgot Password modal already exists, skipping...")
-        return content
+        return []
     
-    forgot_modal = '''
-  <!-- Forgot Password Modal -->
-  <div class="modal-overlay" id="modal-forgot-password">
-    <div class="modal" style="position: relative;">
-      <button class="modal-close" onclick="closeModal('forgot-password')">×</button>
-      <h2>Forgot Password?</h2>
-      <p class="modal-subtitle">Enter your email and we'll send you a reset link</p>
-      
-      <form onsubmit="handleForgotPassword(event)">
-        <div class="form-group">
-          <label for="forgot-email">Email</label>
-          <input type="email" id="forgot-email" placeholder="you@example.com" required>
-        </div>
-        <button type="submit" class="btn btn-primary" style="width: 100%;" id="forgot-submit-btn">Send Reset Link</button>
-      </form>
-      
-      <div class="modal-footer">
-        Remember your password? <a href="#" onclick="switchModal('forgot-password', 'login'); return false;">Log in</a>
-      </div>
-    </div>
-  </div>
-'''
+    forgot_modal = template('forgot_password_modal.html')
     
     # Insert after settings modal
-    settings_modal_end = '</div>\n  </div>\n  \n  <!-- Toast Container -->'
-    if settings_modal_end in content:
-        content = content.replace(settings_modal_end, '</div>\n  </div>\n' + forgot_modal + '\n  <!-- Toast Container -->')
+    if 'settings_end' in landmarks:
+        start = landmarks['settings_end'][0] + len(b'</div>\n  </div>\n')
         print("✓ Added Forgot Password modal")
-    else:
-        # Try to find toast container and insert before it
-        if '<!-- Toast Container -->' in content:
-            content = content.replace('<!-- Toast Container -->', forgot_modal + '\n  <!-- Toast Container -->')
-            print("✓ Added Forgot Password modal (alternative method)")
-        else:
-            print("✗ Could not find insertion point for Forgot Password modal")
-    
-    return content
+        return [(start, landmarks['toast'][0], forgot_modal + b'\n  ')]
+    # Try to find toast container and insert before it
+    if 'toast' in landmarks:
+        start = landmarks['toast'][0]
+        print("✓ Added Forgot Password modal (alternative method)")
+        return [(start, start, forgot_modal + b'\n  ')]
+    print("✗ Could not find insertion point for Forgot Password modal")
+    return []
 
-def add_reset_password_modal(content):
+def add_reset_password_modal(content, landmarks, markers):
     """Add the Reset Password modal after the Forgot Password modal"""
     
-    if 'modal-reset-password' in content:
+    if b'modal-reset-password' in markers:
         print("⚠ Reset Password modal already exists, skipping...")
-        return content
+        return []
     
-    reset_modal = '''
-  <!-- Reset Password Modal -->
-  <div class="modal-overlay" id="modal-reset-password">
-    <div class="modal" style="position: relative;">
-      <button class="modal-close" onclick="closeResetModal()">×</button>
-      <h2>Reset Password</h2>
-      <p class="modal-subtitle" id="reset-email-display">Enter your new password</p>
-      
-      <form onsubmit="handleResetPassword(event)">
-        <div class="form-group">
-          <label for="reset-password">New Password</label>
-          <input type="password" id="reset-password" placeholder="••••••••" minlength="8" required>
-        </div>
-        <div class="form-group">
-          <label for="reset-password-confirm">Confirm Password</label>
-          <input type="password" id="reset-password-confirm" placeholder="••••••••" minlength="8" required>
-        </div>
-        <button type="submit" class="btn btn-primary" style="width: 100%;" id="reset-submit-btn">Reset Password</button>
-      </form>
-    </div>
-  </div>
-'''
+    reset_modal = template('reset_password_modal.html')
     
     # Insert before toast container
-    if '<!-- Toast Container -->' in content:
-        content = content.replace('<!-- Toast Container -->', reset_modal + '\n  <!-- Toast Container -->')
+    if 'toast' in landmarks:
+        start = landmarks['toast'][0]
         print("✓ Added Reset Password modal")
-    else:
-        print("✗ Could not find insertion point for Reset Password modal")
-    
-    return content
+        return [(start, start, reset_modal + b'\n  ')]
+    print("✗ Could not find insertion point for Reset Password modal")
+    return []
 
-def add_password_reset_js(content):
+def add_password_reset_js(content, landmarks, markers):
     """Add JavaScript functions for password reset"""
     
-    if 'handleForgotPassword' in content:
+    if b'handleForgotPassword' in markers:
         print("⚠ Password reset JavaScript already exists, skipping...")
-        return content
-    
-    js_code = '''
-    // ===========================================
-    // PASSWORD RESET FUNCTIONS
-    // ===========================================
+        return []
     
-    let currentResetToken = null;
-    
-    async function handleForgotPassword(event) {
-      event.preventDefault();
-      
-      const email = document.getElementById('forgot-email').value;
-      const submitBtn = document.getElementById('forgot-submit-btn');
-      const originalText = submitBtn.textContent;
-      
-      try {
-        submitBtn.textContent = 'Sending...';
-        submitBtn.disabled = true;
-        
-        const response = await fetch('/api/users/forgot-password', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ email }),
-        });
-        
-        const data = await response.json();
-        
-        if (response.ok) {
-          closeModal('forgot-password');
-          showToast('If an account exists, a reset link has been sent to your email.', 'success');
-          document.getElementById('forgot-email').value = '';
-        } else {
-          showToast(data.error || 'Failed to send reset email', 'error');
-        }
-      } catch (error) {
-        console.error('Forgot password error:', error);
-        showToast('Failed to send reset email', 'error');
-      } finally {
-        submitBtn.textContent = originalText;
-        submitBtn.disabled = false;
-      }
-    }
-    
-    async function handleResetPassword(event) {
-      event.preventDefault();
-      
-      const password = document.getElementById('reset-password').value;
-      const confirmPassword = document.getElementById('reset-password-confirm').value;
-      const submitBtn = document.getElementById('reset-submit-btn');
-      const originalText = submitBtn.textContent;
-      
-      if (password !== confirmPassword) {
-        showToast('Passwords do not match', 'error');
-        return;
-      }
-      
-      if (password.length < 8) {
-        showToast('Password must be at least 8 characters', 'error');
-        return;
-      }
-      
-      if (!currentResetToken) {
-        showToast('Invalid reset token', 'error');
-        return;
-      }
-      
-      try {
-        submitBtn.textContent = 'Resetting...';
-        submitBtn.disabled = true;
-        
-        const response = await fetch('/api/users/reset-password', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ token: currentResetToken, password }),
-        });
-        
-        const data = await response.json();
-        
-        if (response.ok && data.success) {
-          // Auto-login the user
-          state.user = data.user;
-          saveToStorage('user', data.user);
-          
-          closeResetModal();
-          updateUI();
-          showDashboard();
-          await loadWatches();
-          showToast('Password reset successful! Welcome back.', 'success');
-        } else {
-          showToast(data.error || 'Failed to reset password', 'error');
-        }
-      } catch (error) {
-        console.error('Reset password error:', error);
-        showToast('Failed to reset password', 'error');
-      } finally {
-        submitBtn.textContent = originalText;
-        submitBtn.disabled = false;
-      }
-    }
-    
-    function closeResetModal() {
-      closeModal('reset-password');
-      currentResetToken = null;
-      // Clear URL parameter
-      const url = new URL(window.location);
-      url.searchParams.delete('reset');
-      window.history.replaceState({}, '', url);
-      // Clear form
-      document.getElementById('reset-password').value = '';
-      document.getElementById('reset-password-confirm').value = '';
-    }
-    
-    async function checkForResetToken() {
-      const urlParams = new URLSearchParams(window.location.search);
-      const resetToken = urlParams.get('reset');
-      
-      if (resetToken) {
-        try {
-          // Verify the token is valid
-          const response = await fetch(`/api/users/verify-reset-token/${resetToken}`);
-          const data = await response.json();
-          
-          if (data.valid) {
-            currentResetToken = resetToken;
-            document.getElementById('reset-email-display').textContent = 
-              `Enter a new password for ${data.email}`;
-            openModal('reset-password');
-          } else {
-            showToast('This reset link is invalid or has expired.', 'error');
-            // Clear the URL parameter
-            const url = new URL(window.location);
-            url.searchParams.delete('reset');
-            window.history.replaceState({}, '', url);
-          }
-        } catch (error) {
-          console.error('Error verifying reset token:', error);
-          showToast('Failed to verify reset link.', 'error');
-        }
-      }
-    }
-'''
+    # Shared with fix_password_reset_js.py so the two copies cannot drift;
+    # that script inserts it with a trailing blank line, this one without
+    js_code = template('js_functions.js').rstrip() + b'\n'
     
     # Find a good place to insert - after the UTILITY FUNCTIONS section
-    if '// UTILITY FUNCTIONS' in content:
-        # Insert after utility functions section
-        pattern = r'(// ===========================================\s*// UTILITY FUNCTIONS\s*// ===========================================\s*\n\s*function scrollTo\(selector\) \{\s*document\.querySelector\(selector\)\?\.scrollIntoView\(\{ behavior: \'smooth\' \}\);\s*\})'
-        content = re.sub(pattern, r'\1\n' + js_code, content)
+    if 'utility' in landmarks:
+        end = landmarks['utility'][1]
         print("✓ Added password reset JavaScript functions")
-    else:
-        # Try alternative - insert before INITIALIZATION section
-        if '// INITIALIZATION' in content:
-            content = content.replace('// ===========================================\n    // INITIALIZATION', 
-                                     js_code + '\n    // ===========================================\n    // INITIALIZATION')
-            print("✓ Added password reset JavaScript functions (alternative method)")
-        else:
-            print("✗ Could not find insertion point for JavaScript functions")
-    
-    return content
+        return [(end, end, b'\n' + js_code)]
+    # Try alternative - insert before INITIALIZATION section
+    if 'init_header' in landmarks:
+        start = landmarks['init_header'][0]
+        print("✓ Added password reset JavaScript functions (alternative method)")
+        return [(start, start, js_code + b'\n    ')]
+    print("✗ Could not find insertion point for JavaScript functions")
+    return []
 
-def update_init_function(content):
+def update_init_function(content, landmarks, markers):
     """Update init() to check for reset token"""
     
-    if 'checkForResetToken()' in content:
+    if b'checkForResetToken()' in markers:
         print("⚠ init() already checks for reset token, skipping...")
-        return content
-    
-    # Find the init function and add the reset token check
-    # Look for the pattern at the end of init function
-    pattern = r"(async function init\(\) \{[\s\S]*?)(// Run on page load)"
-    
-    match = re.search(pattern, content)
-    if match:
-        # Insert checkForResetToken() call before the end of init
-        old_init = match.group(1)
-        if 'clearStorage();' in old_init:
-            # Insert after the try-catch block in init
-            new_init = old_init.rstrip() + '\n      \n      // Check for password reset token in URL\n      await checkForResetToken();\n    }\n    '
-            # Find the closing brace of init and add our call before it
-            # Actually, let's be more careful
-            pass
+        return []
     
-    # More reliable approach - find the specific pattern
-    old_pattern = '''try {
-          const user = await apiCall(`/users/${savedUser.id}`);
-          state.user = user;
-          updateUI();
-          showDashboard();
-        } catch (error) {
-          // User no longer exists, clear storage
-          clearStorage();
-        }
-      }
-    }'''
-    
-    new_pattern = '''try {
-          const user = await apiCall(`/users/${savedUser.id}`);
-          state.user = user;
-          updateUI();
-          showDashboard();
-        } catch (error) {
-          // User no longer exists, clear storage
-          clearStorage();
-        }
-      }
-      
-      // Check for password reset token in URL
-      await checkForResetToken();
-    }'''
-    
-    if old_pattern in content:
-        content = content.replace(old_pattern, new_pattern)
+    # Find the end of init()'s saved-user block and add the call just before
+    # init()'s closing brace
+    if 'init_try' in landmarks:
+        end = landmarks['init_try'][1] - len(b'\n    }')
         print("✓ Updated init() to check for reset token")
-    else:
-        # Try more flexible pattern
-        if 'clearStorage();' in content and 'checkForResetToken' not in content:
-            # Find init function closing
-            init_pattern = r"(clearStorage\(\);\s*\}\s*\}\s*\})"
-            replacement = r"clearStorage();\n        }\n      }\n      \n      // Check for password reset token in URL\n      await checkForResetToken();\n    }"
-            content = re.sub(init_pattern, replacement, content)
-            print("✓ Updated init() to check for reset token (alternative method)")
-        else:
-            print("⚠ Could not update init() function")
-    
-    return content
+        return [(end, end, b'\n      \n      // Check for password reset token in URL\n      await checkForResetToken();')]
+    # Try more flexible pattern
+    if 'init_clear' in landmarks:
+        # Find init function closing
+        start, end = landmarks['init_clear']
+        print("✓ Updated init() to check for reset token (alternative method)")
+        return [(start, end, b"clearStorage();\n        }\n      }\n      \n      // Check for password reset token in URL\n      await checkForResetToken();\n    }")]
+    print("⚠ Could not update init() function")
+    return []
 
 def main():
     print("=" * 60)
@@ -383,30 +287,43 @@ def main():
         print(f"✗ Error: {INDEX_PATH} not found")
         return 1
     
-    # Create backup
-    print(f"\n📁 Creating backup at {BACKUP_PATH}")
-    shutil.copy(INDEX_PATH, BACKUP_PATH)
-    
-    # Read content
+    # Map the page read-only: landmarks are found in place and the output is
+    # streamed from slices of the mapping, so the page is never held in memory
     print(f"📖 Reading {INDEX_PATH}")
-    content = read_file(INDEX_PATH)
-    original_length = len(content)
-    
-    # Apply patches
-    print("\n🔧 Applying patches...\n")
-    
-    content = patch_login_modal_forgot_link(content)
-    content = add_forgot_password_modal(content)
-    content = add_reset_password_modal(content)
-    content = add_password_reset_js(content)
-    content = update_init_function(content)
-    
-    # Write updated content
-    print(f"\n💾 Writing updated {INDEX_PATH}")
-    write_file(INDEX_PATH, content)
+    with open(INDEX_PATH, 'rb') as f, map_file(f) as content:
+        original_length = len(content)
+        if not original_length:
+            print(f"✗ Error: {INDEX_PATH} is empty, nothing written")
+            return 1
+        
+        # Locate every landmark once; each patch returns (start, end, text)
+        # edits against the original content
+        landmarks = find_landmarks(content)
+        markers = find_markers(content)
+        missing = missing_landmarks(landmarks, markers)
+        if missing:
+            names = ', '.join(marker.decode() for marker in missing)
+            print(f"✗ Error: no insertion point for {names}; {INDEX_PATH} left unchanged")
+            return 1
+        
+        # Apply patches
+        print("\n🔧 Applying patches...\n")
+        
+        edits = []
+        for patch in (patch_login_modal_forgot_link, add_forgot_password_modal,
+                      add_reset_password_modal, add_password_reset_js, update_init_function):
+            edits += patch(content, landmarks, markers)
+        
+        # Back up only now that the templates are loaded and the landmarks
+        # found, so an early failure never leaves the backup behind
+        print(f"\n📁 Creating backup at {BACKUP_PATH}")
+        backup_file(INDEX_PATH, BACKUP_PATH)
+        
+        # Write updated content
+        print(f"\n💾 Writing updated {INDEX_PATH}")
+        new_length = write_file(INDEX_PATH, splice(content, edits))
     
-    new_length = len(content)
-    print(f"\n📊 File size: {original_length:,} → {new_length:,} characters (+{new_length - original_length:,})")
+    print(f"\n📊 File size: {original_length:,} → {new_length:,} bytes (+{new_length - original_length:,})")
     
     print("\n" + "=" * 60)
     print("✅ Patch complete!")
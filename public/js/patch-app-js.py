@@ -3,32 +3,144 @@
 Patch script for app.js - Minifig Support V24
 Usage: python3 patch-app-js.py
 Run from: /var/www/scoutloot/app/public/js/
+Needs patch_common.py and templates/ in /var/www/scoutloot/app/
 """
 
 import os
-import re
 import shutil
+import sys
 from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from patch_common import copy_owner_mode, map_file, template
 
 FILE = "app.js"
+OPEN_BRACE, CLOSE_BRACE = ord('{'), ord('}')
+SLASH, BACKSLASH = ord('/'), ord('\\')
+QUOTES = frozenset(b'\'"')
+BACKTICK, DOLLAR, UNDERSCORE = ord('`'), ord('$'), ord('_')
+OPEN_BRACKET, CLOSE_BRACKET, CLOSE_PAREN = ord('['), ord(']'), ord(')')
+NEWLINE = ord('\n')
+WHITESPACE = frozenset(b' \t\r\n')
+# A '/' after one of these (or after a keyword below) starts a regex literal
+REGEX_PREV = frozenset(b'(,=:[!&|?{};+-*%<>~^')
+REGEX_KEYWORDS = frozenset((b'return', b'typeof', b'case', b'do', b'else', b'in', b'of',
+                            b'new', b'delete', b'void', b'throw', b'instanceof', b'yield', b'await'))
 
-def main():
-    if not os.path.exists(FILE):
-        print(f"Error: {FILE} not found. Run from /var/www/scoutloot/app/public/js/")
-        return 1
-    
-    # Create backup
-    backup = f"{FILE}.bak.{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    shutil.copy(FILE, backup)
-    print(f"Backup created: {backup}")
-    
-    with open(FILE, 'r') as f:
-        content = f.read()
+def find_block_end(content, start):
+    """Return the index just past the '}' closing the first '{' at/after start, or -1
+
+    Braces inside string/template literals, regex literals and comments are
+    skipped; ${...} substitutions inside template literals are walked as code.
+    -1 is also returned when a literal or comment runs off the end.
+    """
+    i = content.find(b'{', start)
+    if i == -1:
+        return -1
+    n = len(content)
+    depth = 0
+    # Brace depths at which an open ${...} substitution returns to its template
+    templates = []
+    # Last significant byte, which decides whether '/' starts a regex literal
+    prev = OPEN_BRACE
+    while i < n:
+        c = content[i]
+        if c == BACKTICK or (c == CLOSE_BRACE and templates and templates[-1] == depth):
+            # Template literal text, from its start or after a substitution
+            if c == CLOSE_BRACE:
+                templates.pop()
+            i += 1
+            while i < n and content[i] != BACKTICK:
+                if content[i] == BACKSLASH:
+                    i += 2
+                elif content[i] == DOLLAR and content[i + 1:i + 2] == b'{':
+                    templates.append(depth)
+                    i += 1
+                    break
+                else:
+                    i += 1
+            else:
+                if i >= n:
+                    return -1
+            prev = content[i]
+        elif c in QUOTES:
+            # Skip to the matching unescaped quote
+            i += 1
+            while i < n and content[i] != c:
+                i += 2 if content[i] == BACKSLASH else 1
+            if i >= n:
+                return -1
+            prev = c
+        elif c == SLASH and content[i + 1:i + 2] == b'/':
+            i = content.find(b'\n', i)
+            if i == -1:
+                return -1
+        elif c == SLASH and content[i + 1:i + 2] == b'*':
+            i = content.find(b'*/', i + 2)
+            if i == -1:
+                return -1
+            i += 1
+        elif c == SLASH and starts_regex(content, i, prev):
+            # Skip to the closing unescaped '/' outside a [...] class
+            i += 1
+            in_class = False
+            while i < n and (in_class or content[i] != SLASH):
+                if content[i] == NEWLINE:
+                    return -1
+                if content[i] == BACKSLASH:
+                    i += 1
+                elif content[i] == OPEN_BRACKET:
+                    in_class = True
+                elif content[i] == CLOSE_BRACKET:
+                    in_class = False
+                i += 1
+            if i >= n:
+                return -1
+            prev = CLOSE_PAREN
+        else:
+            if c == OPEN_BRACE:
+                depth += 1
+            elif c == CLOSE_BRACE:
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            if c not in WHITESPACE:
+                prev = c
+        i += 1
+    return -1
+
+def starts_regex(content, i, prev):
+    """Whether the '/' at content[i] opens a regex literal rather than dividing"""
+    if prev in REGEX_PREV:
+        return True
+    if not (prev == UNDERSCORE or prev == DOLLAR or chr(prev).isalnum()):
+        return False
+    # After an identifier it divides, unless the word is a keyword like return
+    j = i
+    while j > 0 and content[j - 1] in WHITESPACE:
+        j -= 1
+    k = j
+    while k > 0 and (chr(content[k - 1]).isalnum() or content[k - 1] in (UNDERSCORE, DOLLAR)):
+        k -= 1
+    return bytes(content[k:j]) in REGEX_KEYWORDS
+
+def literal_edit(content, old, new):
+    """Return [(start, end, new)] replacing the first occurrence of old, or []"""
+    old = old.encode('utf-8')
+    start = content.find(old)
+    if start == -1:
+        return []
+    return [(start, start + len(old), new.encode('utf-8'))]
+
+def collect_edits(content):
+    """Return the (start, end, text) edits for every patch against content, or None"""
+    edits = []
     
     # ===========================================
     # PATCH 1: Add new variables after selectedSetNumber
     # ===========================================
-    content = content.replace(
+    edits += literal_edit(content,
         'let selectedSetNumber = null;',
         '''let selectedSetNumber = null;
 let selectedItemType = 'set';  // 'set' or 'minifig'
@@ -51,13 +163,13 @@ let selectedMinifigId = null;'''
       }
     }, 300);'''
     
-    content = content.replace(old_autocomplete, new_autocomplete)
+    edits += literal_edit(content, old_autocomplete, new_autocomplete)
     print("✓ Patch 2: Updated initAutocomplete for minifig search")
     
     # ===========================================
     # PATCH 3: Update selectSet to clear minifig
     # ===========================================
-    content = content.replace(
+    edits += literal_edit(content,
         '''input.value = setNum;
   selectedSetNumber = setNum;
   results.classList.remove('active');''',
@@ -71,183 +183,33 @@ let selectedMinifigId = null;'''
     # ===========================================
     # PATCH 4: Add new minifig functions before handleAddWatch
     # ===========================================
-    new_functions = '''
-// ===========================================
-// MINIFIG SUPPORT FUNCTIONS (V24)
-// ===========================================
-
-function switchWatchType(type) {
-  selectedItemType = type;
-  selectedSetNumber = null;
-  selectedMinifigId = null;
-  
-  document.querySelectorAll('.watch-type-toggle .toggle-btn').forEach(btn => {
-    btn.classList.toggle('active', btn.dataset.type === type);
-  });
-  
-  const input = document.getElementById('watch-set');
-  const results = document.getElementById('set-autocomplete');
-  
-  if (type === 'set') {
-    input.placeholder = 'e.g., 75192 or Millennium Falcon';
-  } else {
-    input.placeholder = 'e.g., sw0001 or Darth Vader';
-  }
-  
-  input.value = '';
-  results.classList.remove('active');
-  results.innerHTML = '';
-}
-
-async function searchMinifigs(query) {
-  const results = document.getElementById('set-autocomplete');
-  
-  results.innerHTML = '<div class="autocomplete-loading">Searching minifigs...</div>';
-  results.classList.add('active');
-  
-  try {
-    const response = await fetch(`/api/minifigs/search?q=${encodeURIComponent(query)}`);
-    const data = await response.json();
-    
-    if (!data.results || data.results.length === 0) {
-      results.innerHTML = '<div class="autocomplete-empty">No minifigures found</div>';
-      return;
-    }
-    
-    results.innerHTML = data.results.map(fig => `
-      <div class="autocomplete-item" onclick="selectMinifig('${fig.fig_num}', '${escapeHtml(fig.name)}')">
-        <div class="autocomplete-item-image">
-          ${fig.set_img_url 
-            ? `<img src="${fig.set_img_url}" alt="${escapeHtml(fig.name)}" onerror="this.parentElement.innerHTML='🧍'">`
-            : '🧍'
-          }
-        </div>
-        <div class="autocomplete-item-info">
-          <div class="autocomplete-item-name">${escapeHtml(fig.name)}</div>
-          <div class="autocomplete-item-meta">${fig.fig_num} • ${fig.num_parts || '?'} parts</div>
-        </div>
-      </div>
-    `).join('');
-    
-  } catch (error) {
-    console.error('Minifig search error:', error);
-    results.innerHTML = '<div class="autocomplete-empty">Search failed</div>';
-  }
-}
-
-function selectMinifig(figNum, figName) {
-  const input = document.getElementById('watch-set');
-  const results = document.getElementById('set-autocomplete');
-  
-  input.value = figNum;
-  selectedMinifigId = figNum;
-  selectedSetNumber = null;
-  results.classList.remove('active');
-  
-  document.getElementById('watch-target').focus();
-  
-  showToast(`Selected: ${figName}`, 'success');
-}
-
-'''
+    new_functions = template('minifig_functions.js')
     
-    content = content.replace(
-        'async function handleAddWatch(event) {',
-        new_functions + 'async function handleAddWatch(event) {'
-    )
+    # Inserted together with the PATCH 5 replacement of handleAddWatch below
     print("✓ Patch 4: Added minifig support functions")
     
     # ===========================================
     # PATCH 5: Replace handleAddWatch function
     # ===========================================
-    # Find and replace the entire handleAddWatch function
-    pattern = r'async function handleAddWatch\(event\) \{[^}]*?event\.preventDefault\(\);.*?finally \{[^}]*?submitBtn\.disabled = false;[^}]*?\}[^}]*?\}'
-    
-    new_handleAddWatch = '''async function handleAddWatch(event) {
-  event.preventDefault();
-  
-  if (!state.user) {
-    showToast('Please log in first', 'error');
-    return;
-  }
-  
-  // Determine item type and ID (V24: minifig support)
-  let itemType = selectedItemType || 'set';
-  let itemId;
-  
-  if (itemType === 'minifig') {
-    itemId = selectedMinifigId || document.getElementById('watch-set').value.trim();
-  } else {
-    itemId = selectedSetNumber || document.getElementById('watch-set').value.trim();
-  }
-  
-  if (!itemId) {
-    showToast('Please select a set or minifigure', 'error');
-    return;
-  }
-  
-  const targetPrice = parseFloat(document.getElementById('watch-target').value);
-  const minPrice = parseFloat(document.getElementById('watch-min').value) || 0;
-  const condition = document.getElementById('watch-condition').value;
-  
-  const submitBtn = document.getElementById('add-watch-submit-btn');
-  const originalText = submitBtn.textContent;
-  
-  try {
-    submitBtn.textContent = 'Adding...';
-    submitBtn.disabled = true;
-    
-    const body = {
-      user_id: state.user.id,
-      item_type: itemType,
-      item_id: itemId,
-      target_total_price_eur: targetPrice,
-      min_total_eur: minPrice,
-      condition: condition,
-    };
-    
-    if (itemType === 'set') {
-      body.set_number = itemId;
-    }
-    
-    const watch = await apiCall('/watches', {
-      method: 'POST',
-      body: JSON.stringify(body),
-    });
-    
-    state.watches.push(watch);
-    closeModal('add-watch');
-    renderWatches();
-    updateDashboardStats();
-    
-    const typeLabel = itemType === 'minifig' ? 'minifig' : 'set';
-    showToast(`Now tracking ${typeLabel} ${itemId}! 🔔`, 'success');
-    
-    event.target.reset();
-    selectedSetNumber = null;
-    selectedMinifigId = null;
-    selectedItemType = 'set';
-    
-    const setToggle = document.querySelector('.watch-type-toggle .toggle-btn[data-type="set"]');
-    if (setToggle) {
-      switchWatchType('set');
-    }
-    
-  } catch (error) {
-    showToast(error.message || 'Failed to add watch', 'error');
-  } finally {
-    submitBtn.textContent = originalText;
-    submitBtn.disabled = false;
-  }
-}'''
-    
-    content = re.sub(pattern, new_handleAddWatch, content, flags=re.DOTALL)
+    # Find and replace the entire handleAddWatch function by walking braces
+    # from its opening line (linear, no regex backtracking)
+    
+    new_handleAddWatch = template('handle_add_watch.js')
+    
+    start = content.find(b'async function handleAddWatch(event) {')
+    if start >= 0:
+        end = find_block_end(content, start)
+        if end < 0:
+            # A mis-scanned literal would splice at the wrong brace; stop instead
+            print("✗ Patch 5: Could not find the end of handleAddWatch")
+            return None
+        edits.append((start, end, new_functions + new_handleAddWatch))
     print("✓ Patch 5: Replaced handleAddWatch function")
     
     # ===========================================
     # PATCH 6: Update renderWatches empty state
     # ===========================================
-    content = content.replace(
+    edits += literal_edit(content,
         "No watches yet. Add your first LEGO set to start tracking deals!",
         "No watches yet. Add your first LEGO set or minifig to start tracking deals!"
     )
@@ -289,7 +251,7 @@ function selectMinifig(figNum, figName) {
         <div class="watch-title">${displayName}${watch.set_year ? ` <span class="watch-year">(${watch.set_year})</span>` : ''} ${typeBadge}</div>
         <div class="watch-set-number">${displayNumber}${watch.set_pieces ? ` • ${watch.set_pieces} pieces` : ''}</div>'''
     
-    content = content.replace(old_watch_template, new_watch_template)
+    edits += literal_edit(content, old_watch_template, new_watch_template)
     
     # Also need to close the arrow function properly
     # Find the end of watch-item template and add closing
@@ -304,12 +266,41 @@ function selectMinifig(figNum, figName) {
   }).join('');
 }'''
     
-    content = content.replace(old_closing, new_closing)
+    edits += literal_edit(content, old_closing, new_closing)
     print("✓ Patch 7: Updated renderWatches for minifig display")
     
-    # Write the patched file
-    with open(FILE, 'w') as f:
-        f.write(content)
+    return edits
+
+def main():
+    if not os.path.exists(FILE):
+        print(f"Error: {FILE} not found. Run from /var/www/scoutloot/app/public/js/")
+        return 1
+    
+    # Map app.js read-only and collect (start, end, text) edits against it;
+    # the output is streamed from slices of the mapping in a single pass
+    with open(FILE, 'rb') as f, map_file(f) as content:
+        edits = collect_edits(content)
+        if edits is None:
+            print(f"\n❌ {FILE} left unchanged")
+            return 1
+        
+        # Create backup (after the templates have loaded, before any write)
+        backup = f"{FILE}.bak.{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        shutil.copy(FILE, backup)
+        print(f"Backup created: {backup}")
+        
+        # Write the patched file: stream slices and edits into a temp file, then
+        # rename it over app.js (app.js is still mapped, so never write it in place)
+        tmp = f"{FILE}.tmp"
+        pos = 0
+        with open(tmp, 'wb') as out:
+            for start, end, text in sorted(edits, key=lambda e: e[0]):
+                out.write(content[pos:start])
+                out.write(text)
+                pos = end
+            out.write(content[pos:])
+        copy_owner_mode(FILE, tmp)
+        os.replace(tmp, FILE)
     
     print(f"\n✅ All patches applied successfully!")
     print(f"\nBackup saved to: {backup}")
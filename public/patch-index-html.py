@@ -3,59 +3,22 @@
 Patch script for index.html - Minifig Support V24
 Usage: python3 patch-index-html.py
 Run from: /var/www/scoutloot/app/public/
+Needs patch_common.py in /var/www/scoutloot/app/
 """
 
 import os
 import shutil
-from datetime import datetime
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from patch_common import sendfile_copy
 
 FILE = "index.html"
 
-def main():
-    if not os.path.exists(FILE):
-        print(f"Error: {FILE} not found. Run from /var/www/scoutloot/app/public/")
-        return 1
-    
-    # Create backup
-    backup = f"{FILE}.bak.{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    shutil.copy(FILE, backup)
-    print(f"Backup created: {backup}")
-    
-    with open(FILE, 'r') as f:
-        content = f.read()
-    
-    # ===========================================
-    # PATCH 1: Add toggle buttons to Add Watch modal
-    # ===========================================
-    old_form_start = '''<form class="add-watch-form" onsubmit="handleAddWatch(event)">
-        <div class="form-group autocomplete-container">
-          <label for="watch-set">Set Number or Name</label>'''
-    
-    new_form_start = '''<form class="add-watch-form" onsubmit="handleAddWatch(event)">
-        <!-- V24: Item Type Toggle -->
-        <div class="watch-type-toggle">
-          <button type="button" class="toggle-btn active" data-type="set" onclick="switchWatchType('set')">
-            🧱 Set
-          </button>
-          <button type="button" class="toggle-btn" data-type="minifig" onclick="switchWatchType('minifig')">
-            🧍 Minifigure
-          </button>
-        </div>
-        
-        <div class="form-group autocomplete-container">
-          <label for="watch-set">Set Number or Name</label>'''
-    
-    if old_form_start in content:
-        content = content.replace(old_form_start, new_form_start)
-        print("✓ Patch 1: Added item type toggle to Add Watch modal")
-    else:
-        print("⚠ Patch 1: Could not find form start pattern (may already be patched)")
-    
-    # ===========================================
-    # PATCH 2: Add CSS for toggle and badge
-    # Find </style> and insert before it
-    # ===========================================
-    css_additions = '''
+# PATCH 2 payload, inserted before the last </style>
+CSS_ADDITIONS = b'''
 /* V24: Minifig Support Styles */
 .watch-type-toggle {
   display: flex;
@@ -118,19 +81,79 @@ def main():
 }
 
 '''
+
+def main():
+    if not os.path.exists(FILE):
+        print(f"Error: {FILE} not found. Run from /var/www/scoutloot/app/public/")
+        return 1
+    
+    # Create backup
+    backup = f"{FILE}.bak.{time.strftime('%Y%m%d%H%M%S')}"
+    if hasattr(os, 'sendfile'):
+        sendfile_copy(FILE, backup)
+        shutil.copymode(FILE, backup)
+    else:
+        shutil.copy(FILE, backup)
+    print(f"Backup created: {backup}")
+    
+    # Bytes throughout: every needle is ASCII, so there is no decode/encode
+    with open(FILE, 'rb') as f:
+        content = f.read()
+    
+    # ===========================================
+    # PATCH 1: Add toggle buttons to Add Watch modal
+    # ===========================================
+    old_form_start = b'''<form class="add-watch-form" onsubmit="handleAddWatch(event)">
+        <div class="form-group autocomplete-container">
+          <label for="watch-set">Set Number or Name</label>'''
+    
+    new_form_start = '''<form class="add-watch-form" onsubmit="handleAddWatch(event)">
+        <!-- V24: Item Type Toggle -->
+        <div class="watch-type-toggle">
+          <button type="button" class="toggle-btn active" data-type="set" onclick="switchWatchType('set')">
+            🧱 Set
+          </button>
+          <button type="button" class="toggle-btn" data-type="minifig" onclick="switchWatchType('minifig')">
+            🧍 Minifigure
+          </button>
+        </div>
+        
+        <div class="form-group autocomplete-container">
+          <label for="watch-set">Set Number or Name</label>'''.encode('utf-8')
+    
+    # Patches are collected as (start, end, text) edits against the original
+    # content and only stitched together when the file is written
+    edits = []
+    
+    form_pos = content.find(old_form_start)
+    if form_pos != -1:
+        edits.append((form_pos, form_pos + len(old_form_start), new_form_start))
+        print("✓ Patch 1: Added item type toggle to Add Watch modal")
+    else:
+        print("⚠ Patch 1: Could not find form start pattern (may already be patched)")
+    
+    # ===========================================
+    # PATCH 2: Add CSS for toggle and badge
+    # Find </style> and insert before it
+    # ===========================================
     
-    # Find the last </style> tag and insert before it
-    if '</style>' in content:
-        # Insert before the last </style>
-        last_style_pos = content.rfind('</style>')
-        content = content[:last_style_pos] + css_additions + content[last_style_pos:]
+    # Find the last </style> tag and insert CSS_ADDITIONS before it
+    last_style_pos = content.rfind(b'</style>')
+    if last_style_pos != -1:
+        edits.append((last_style_pos, last_style_pos, CSS_ADDITIONS))
         print("✓ Patch 2: Added CSS for toggle and minifig badge")
     else:
         print("⚠ Patch 2: Could not find </style> tag")
     
     # Write the patched file
-    with open(FILE, 'w') as f:
-        f.write(content)
+    pieces = []
+    pos = 0
+    for start, end, text in sorted(edits, key=lambda e: e[0]):
+        pieces += (content[pos:start], text)
+        pos = end
+    pieces.append(content[pos:])
+    with open(FILE, 'wb') as f:
+        f.writelines(pieces)
     
     print(f"\n✅ All patches applied successfully!")
     print(f"\nBackup saved to: {backup}")
@@ -0,0 +1,77 @@
+async function handleAddWatch(event) {
+  event.preventDefault();
+  
+  if (!state.user) {
+    showToast('Please log in first', 'error');
+    return;
+  }
+  
+  // Determine item type and ID (V24: minifig support)
+  let itemType = selectedItemType || 'set';
+  let itemId;
+  
+  if (itemType === 'minifig') {
+    itemId = selectedMinifigId || document.getElementById('watch-set').value.trim();
+  } else {
+    itemId = selectedSetNumber || document.getElementById('watch-set').value.trim();
+  }
+  
+  if (!itemId) {
+    showToast('Please select a set or minifigure', 'error');
+    return;
+  }
+  
+  const targetPrice = parseFloat(document.getElementById('watch-target').value);
+  const minPrice = parseFloat(document.getElementById('watch-min').value) || 0;
+  const condition = document.getElementById('watch-condition').value;
+  
+  const submitBtn = document.getElementById('add-watch-submit-btn');
+  const originalText = submitBtn.textContent;
+  
+  try {
+    submitBtn.textContent = 'Adding...';
+    submitBtn.disabled = true;
+    
+    const body = {
+      user_id: state.user.id,
+      item_type: itemType,
+      item_id: itemId,
+      target_total_price_eur: targetPrice,
+      min_total_eur: minPrice,
+      condition: condition,
+    };
+    
+    if (itemType === 'set') {
+      body.set_number = itemId;
+    }
+    
+    const watch = await apiCall('/watches', {
+      method: 'POST',
+      body: JSON.stringify(body),
+    });
+    
+    state.watches.push(watch);
+    closeModal('add-watch');
+    renderWatches();
+    updateDashboardStats();
+    
+    const typeLabel = itemType === 'minifig' ? 'minifig' : 'set';
+    showToast(`Now tracking ${typeLabel} ${itemId}! 🔔`, 'success');
+    
+    event.target.reset();
+    selectedSetNumber = null;
+    selectedMinifigId = null;
+    selectedItemType = 'set';
+    
+    const setToggle = document.querySelector('.watch-type-toggle .toggle-btn[data-type="set"]');
+    if (setToggle) {
+      switchWatchType('set');
+    }
+    
+  } catch (error) {
+    showToast(error.message || 'Failed to add watch', 'error');
+  } finally {
+    submitBtn.textContent = originalText;
+    submitBtn.disabled = false;
+  }
+}
\ No newline at end of file
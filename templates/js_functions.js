@@ -0,0 +1,142 @@
+
+    // ===========================================
+    // PASSWORD RESET FUNCTIONS
+    // ===========================================
+    
+    let currentResetToken = null;
+    let resetPasswordEl = null;
+    let resetPasswordConfirmEl = null;
+    
+    async function handleForgotPassword(event) {
+      event.preventDefault();
+      
+      const emailEl = document.getElementById('forgot-email');
+      const email = emailEl.value;
+      const submitBtn = document.getElementById('forgot-submit-btn');
+      const originalText = submitBtn.textContent;
+      
+      try {
+        submitBtn.textContent = 'Sending...';
+        submitBtn.disabled = true;
+        
+        const response = await fetch('/api/users/forgot-password', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: '{"email":' + JSON.stringify(email) + '}',
+        });
+        
+        const data = await response.json();
+        
+        if (response.ok) {
+          closeModal('forgot-password');
+          showToast('If an account exists, a reset link has been sent to your email.', 'success');
+          emailEl.value = '';
+        } else {
+          showToast(data.error || 'Failed to send reset email', 'error');
+        }
+      } catch (error) {
+        console.error('Forgot password error:', error);
+        showToast('Failed to send reset email', 'error');
+      } finally {
+        submitBtn.textContent = originalText;
+        submitBtn.disabled = false;
+      }
+    }
+    
+    async function handleResetPassword(event) {
+      event.preventDefault();
+      
+      const pwEl = resetPasswordEl || document.getElementById('reset-password');
+      const confEl = resetPasswordConfirmEl || document.getElementById('reset-password-confirm');
+      const password = pwEl.value;
+      const confirmPassword = confEl.value;
+      const submitBtn = document.getElementById('reset-submit-btn');
+      const originalText = submitBtn.textContent;
+      
+      if (password !== confirmPassword) {
+        showToast('Passwords do not match', 'error');
+        return;
+      }
+      
+      if (password.length < 8) {
+        showToast('Password must be at least 8 characters', 'error');
+        return;
+      }
+      
+      if (!currentResetToken) {
+        showToast('Invalid reset token', 'error');
+        return;
+      }
+      
+      try {
+        submitBtn.textContent = 'Resetting...';
+        submitBtn.disabled = true;
+        
+        const response = await fetch('/api/users/reset-password', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: '{"token":' + JSON.stringify(currentResetToken) + ',"password":' + JSON.stringify(password) + '}',
+        });
+        
+        const data = await response.json();
+        
+        if (response.ok && data.success) {
+          state.user = data.user;
+          saveToStorage('user', data.user);
+          
+          closeResetModal();
+          updateUI();
+          showDashboard();
+          await loadWatches();
+          showToast('Password reset successful! Welcome back.', 'success');
+        } else {
+          showToast(data.error || 'Failed to reset password', 'error');
+        }
+      } catch (error) {
+        console.error('Reset password error:', error);
+        showToast('Failed to reset password', 'error');
+      } finally {
+        submitBtn.textContent = originalText;
+        submitBtn.disabled = false;
+      }
+    }
+    
+    function closeResetModal() {
+      closeModal('reset-password');
+      currentResetToken = null;
+      const url = new URL(window.location);
+      url.searchParams.delete('reset');
+      window.history.replaceState({}, '', url);
+      (resetPasswordEl || document.getElementById('reset-password')).value = '';
+      (resetPasswordConfirmEl || document.getElementById('reset-password-confirm')).value = '';
+    }
+    
+    async function checkForResetToken() {
+      const urlParams = new URLSearchParams(window.location.search);
+      const resetToken = urlParams.get('reset');
+      
+      if (resetToken) {
+        try {
+          const response = await fetch('/api/users/verify-reset-token/' + resetToken);
+          const data = await response.json();
+          
+          if (data.valid) {
+            currentResetToken = resetToken;
+            resetPasswordEl = document.getElementById('reset-password');
+            resetPasswordConfirmEl = document.getElementById('reset-password-confirm');
+            document.getElementById('reset-email-display').textContent = 
+              'Enter a new password for ' + data.email;
+            openModal('reset-password');
+          } else {
+            showToast('This reset link is invalid or has expired.', 'error');
+            const url = new URL(window.location);
+            url.searchParams.delete('reset');
+            window.history.replaceState({}, '', url);
+          }
+        } catch (error) {
+          console.error('Error verifying reset token:', error);
+          showToast('Failed to verify reset link.', 'error');
+        }
+      }
+    }
+
@@ -5,35 +5,169 @@ ScoutLoot V29 Patch Script
 Fixes: Condition dropdown (USED not showing, default to NEW)
 Adds: Bulk condition change, prefillWatch listener, signup flow from detail pages
 
-Usage: Upload this script to server and run:
+Usage: Upload this script and patch_common.py to server and run:
   python3 v29_patch.py
   
 Then build and restart:
   cd /var/www/scoutloot/app && npm run build && pm2 restart scoutloot scoutloot-worker
 """
 
+import hashlib
 import os
 import re
 import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from patch_common import map_file, patch_in_place, sendfile_copy
+
 APP_DIR = Path('/var/www/scoutloot/app')
 
+# One timestamp per run, shared by every backup so a run can be rolled back
+# as a set
+BACKUP_SUFFIX = f".bak.v29.{time.strftime('%Y%m%d%H%M%S')}"
+
+# blake2b-128 digests of files exactly as this script (or an earlier revision
+# of it) leaves them; a file that already matches is skipped without being
+# backed up, read or rewritten
+_PATCHED_SHA = {
+    'public/index.html': ('429a559bd7f056e04223c60a98c6220b',),
+    'public/js/app.js': ('cad09eb24fd2ce44d2c174d773f91ae7',),
+    'src/routes/watches.ts': ('1759714b36165e3f3f3df29b5ceb86e3', '31e58bcd25ddc2b4bc556f4dbc1e19f1'),
+}
+
+# Where patch_watches_ts inserts the bulk-condition endpoint: the earliest
+# user-watches banner or route in the file
+WATCHES_INSERT_RE = re.compile(r"// =+\n// GET USER|// GET USER'S WATCHES|// GET USER WATCHES|router\.get\('/user/:userId'")
+
+# Fallback: right after the router is created
+ROUTER_DEF = "const router = Router();"
+
+# (path, bytes, open flag) writes collected by the patch functions and done by
+# flush_writes(): os.O_TRUNC replaces the file, os.O_APPEND adds to its end
+pending_writes = []
+
+# Sentinels to touch once flush_writes() has written their files
+pending_sentinels = []
+
+# Backups actually made by backup_file() this run, {filepath: backup_path};
+# main() prints rollback commands for these only
+created_backups = {}
+
+def sentinel_path(filepath):
+    """Marker file recording that filepath has been patched by V29"""
+    return filepath.with_name(filepath.name + '.v29-applied')
+
+def has_sentinel(filepath):
+    """True if filepath's sentinel exists and is not older than the file itself"""
+    try:
+        return sentinel_path(filepath).stat().st_mtime_ns >= filepath.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+def flush_writes():
+    """Do every pending write, one open + vectored write per file"""
+    # Patches run concurrently, so write in path order rather than finish order
+    pending_writes.sort(key=lambda w: w[0])
+    while pending_writes:
+        filepath, data, mode = pending_writes.pop(0)
+        data = memoryview(data)
+        fd = os.open(filepath, os.O_WRONLY | mode)
+        try:
+            while data:
+                data = data[os.writev(fd, [data]):]
+        finally:
+            os.close(fd)
+        print(f"💾 Saved {filepath}")
+    while pending_sentinels:
+        pending_sentinels.pop().touch()
+
+class _ThreadBufferedStdout:
+    """stdout proxy that collects a worker thread's output in its own buffer"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    
+    def write(self, text):
+        buf = getattr(self.local, 'buf', None)
+        if buf is None:
+            return self.stream.write(text)
+        buf.append(text)
+        return len(text)
+    
+    def flush(self):
+        self.stream.flush()
+    
+    def run(self, fn):
+        """Call fn, returning (its printed output, the exception it raised or None)"""
+        self.local.buf = []
+        try:
+            fn()
+            error = None
+        except Exception as e:
+            error = e
+        output = ''.join(self.local.buf)
+        self.local.buf = None
+        return output, error
+
+def is_patched(filepath):
+    """Check filepath against its known V29-patched digests"""
+    expected = _PATCHED_SHA.get(filepath.relative_to(APP_DIR).as_posix())
+    if not expected or not filepath.exists():
+        return False
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest() in expected
+
 def backup_file(filepath):
-    """Create a backup with .bak.v29 suffix"""
-    backup_path = filepath.with_suffix(filepath.suffix + '.bak.v29')
+    """Create a backup with this run's .bak.v29.<timestamp> suffix"""
+    backup_path = filepath.with_suffix(filepath.suffix + BACKUP_SUFFIX)
     if filepath.exists():
-        shutil.copy2(filepath, backup_path)
+        if hasattr(os, 'sendfile'):
+            sendfile_copy(filepath, backup_path)
+            shutil.copystat(filepath, backup_path)
+        else:
+            shutil.copy2(filepath, backup_path)
+        created_backups[filepath] = backup_path
         return True
     return False
 
+def find_edits(content, patches):
+    """Locate the first occurrence of each (old, new) patch in content.
+
+    Returns (offset, old_len, new) edits sorted by offset, skipping any that
+    overlap an earlier one, and a list of flags saying which patches hit.
+    """
+    hits = sorted((idx, i) for i, (old, new) in enumerate(patches)
+                  if (idx := content.find(old)) != -1)
+    applied = [False] * len(patches)
+    edits = []
+    cursor = 0
+    for idx, i in hits:
+        old, new = patches[i]
+        if idx < cursor:
+            continue  # overlaps an earlier replacement
+        edits.append((idx, len(old), new))
+        cursor = idx + len(old)
+        applied[i] = True
+    return edits, applied
+
 def patch_index_html():
     """Fix condition dropdowns and add bulk condition change"""
     filepath = APP_DIR / 'public' / 'index.html'
     print(f"📄 Patching {filepath}...")
     
+    if is_patched(filepath):
+        print("   ⚠️ index.html already matches the V29 patched version, skipping")
+        return
+    
     backup_file(filepath)
-    content = filepath.read_text(encoding='utf-8')
     
     # PATCH 1: Fix Add Watch Modal condition dropdown
     # Find the broken dropdown with <label> instead of <option>
@@ -49,12 +183,6 @@ def patch_index_html():
             <option value="any">{{forms.condition_any}}</option>
           </select>'''
     
-    if old_add_watch in content:
-        content = content.replace(old_add_watch, new_add_watch)
-        print("   ✅ Fixed Add Watch condition dropdown")
-    else:
-        print("   ⚠️ Add Watch dropdown pattern not found (may already be fixed)")
-    
     # PATCH 2: Fix Edit Watch Modal condition dropdown
     old_edit_watch = '''<select id="edit-watch-condition">
             <option value="any">{{forms.condition_any}}</option>
@@ -68,12 +196,6 @@ def patch_index_html():
             <option value="any">{{forms.condition_any}}</option>
           </select>'''
     
-    if old_edit_watch in content:
-        content = content.replace(old_edit_watch, new_edit_watch)
-        print("   ✅ Fixed Edit Watch condition dropdown")
-    else:
-        print("   ⚠️ Edit Watch dropdown pattern not found (may already be fixed)")
-    
     # PATCH 3: Add bulk condition change dropdown to watches header
     old_watches_header = '''<div class="watches-header">
             <h2>{{dashboard.your_watchlist}}</h2>
@@ -89,13 +211,28 @@ def patch_index_html():
             </select>
           </div>'''
     
-    if old_watches_header in content:
-        content = content.replace(old_watches_header, new_watches_header)
+    # Locate the patches as bytes in a read-only map and rewrite the file in place
+    patches = [(old.encode('utf-8'), new.encode('utf-8')) for old, new in (
+        (old_add_watch, new_add_watch),
+        (old_edit_watch, new_edit_watch),
+        (old_watches_header, new_watches_header),
+    )]
+    with open(filepath, 'rb') as f, map_file(f) as mm:
+        edits, (add_fixed, edit_fixed, header_added) = find_edits(mm, patches)
+    patch_in_place(filepath, edits)
+    if add_fixed:
+        print("   ✅ Fixed Add Watch condition dropdown")
+    else:
+        print("   ⚠️ Add Watch dropdown pattern not found (may already be fixed)")
+    if edit_fixed:
+        print("   ✅ Fixed Edit Watch condition dropdown")
+    else:
+        print("   ⚠️ Edit Watch dropdown pattern not found (may already be fixed)")
+    if header_added:
         print("   ✅ Added bulk condition dropdown to watches header")
     else:
         print("   ⚠️ Watches header pattern not found (may already be patched)")
     
-    filepath.write_text(content, encoding='utf-8')
     print(f"   💾 Saved {filepath}")
 
 def patch_app_js():
@@ -103,11 +240,24 @@ def patch_app_js():
     filepath = APP_DIR / 'public' / 'js' / 'app.js'
     print(f"📄 Patching {filepath}...")
     
+    # A sentinel from an earlier run skips the file without reading it
+    if has_sentinel(filepath):
+        print("   ⚠️ app.js already patched by V29 (sentinel found), skipping")
+        return
+    
+    if is_patched(filepath):
+        sentinel_path(filepath).touch()
+        print("   ⚠️ app.js already matches the V29 patched version, skipping")
+        return
+    
     backup_file(filepath)
-    content = filepath.read_text(encoding='utf-8')
     
-    # Check if already patched
-    if 'handleBulkConditionChange' in content:
+    # Check if already patched (probed in place; app.js is only appended to,
+    # so it is never read into memory)
+    with open(filepath, 'rb') as f, map_file(f) as mm:
+        already_patched = mm.find(b'handleBulkConditionChange') != -1
+    if already_patched:
+        sentinel_path(filepath).touch()
         print("   ⚠️ app.js already contains V29 functions, skipping")
         return
     
@@ -193,22 +343,32 @@ async function handleBulkConditionChange(condition) {
 }
 '''
     
-    content += new_js
-    filepath.write_text(content, encoding='utf-8')
+    pending_writes.append((filepath, new_js.encode('utf-8'), os.O_APPEND))
+    pending_sentinels.append(sentinel_path(filepath))
     print("   ✅ Added prefillWatch listener")
     print("   ✅ Added handleBulkConditionChange function")
-    print(f"   💾 Saved {filepath}")
 
 def patch_watches_ts():
     """Add bulk condition API endpoint"""
     filepath = APP_DIR / 'src' / 'routes' / 'watches.ts'
     print(f"📄 Patching {filepath}...")
     
+    # A sentinel from an earlier run skips the file without reading it
+    if has_sentinel(filepath):
+        print("   ⚠️ watches.ts already patched by V29 (sentinel found), skipping")
+        return
+    
+    if is_patched(filepath):
+        sentinel_path(filepath).touch()
+        print("   ⚠️ watches.ts already matches the V29 patched version, skipping")
+        return
+    
     backup_file(filepath)
     content = filepath.read_text(encoding='utf-8')
     
     # Check if already patched
     if 'bulk-condition' in content:
+        sentinel_path(filepath).touch()
         print("   ⚠️ watches.ts already contains bulk-condition endpoint, skipping")
         return
     
@@ -255,35 +415,25 @@ router.patch('/bulk-condition/:userId', async (req: Request, res: Response): Pro
 
 '''
     
-    # Insert after the router definition but before user routes
-    # Look for "GET USER" or "router.get('/user" pattern
-    patterns_to_find = [
-        "// GET USER'S WATCHES",
-        "// GET USER WATCHES", 
-        "router.get('/user/:userId'",
-        "// ============================================\n// GET USER"
-    ]
-    
-    inserted = False
-    for pattern in patterns_to_find:
-        if pattern in content:
-            content = content.replace(pattern, new_endpoint + pattern)
-            inserted = True
-            break
+    # Insert after the router definition but before user routes, at the
+    # first "GET USER" banner or router.get('/user/...') route
+    m = WATCHES_INSERT_RE.search(content)
+    inserted = m is not None
+    if inserted:
+        content = content[:m.start()] + new_endpoint + content[m.start():]
     
     if not inserted:
         # Fallback: insert after first router definition
-        if "const router = Router();" in content:
-            content = content.replace(
-                "const router = Router();",
-                "const router = Router();" + new_endpoint
-            )
-            inserted = True
+        i = content.find(ROUTER_DEF)
+        inserted = i != -1
+        if inserted:
+            i += len(ROUTER_DEF)
+            content = content[:i] + new_endpoint + content[i:]
     
     if inserted:
-        filepath.write_text(content, encoding='utf-8')
+        pending_writes.append((filepath, content.encode('utf-8'), os.O_TRUNC))
+        pending_sentinels.append(sentinel_path(filepath))
         print("   ✅ Added bulk-condition endpoint")
-        print(f"   💾 Saved {filepath}")
     else:
         print("   ❌ Could not find insertion point for bulk-condition endpoint")
         print("      Please add manually - see V29_MANUAL_PATCH.md")
@@ -306,9 +456,8 @@ def patch_set_html():
     
     if old_pattern in content:
         content = content.replace(old_pattern, new_pattern)
-        filepath.write_text(content, encoding='utf-8')
+        pending_writes.append((filepath, content.encode('utf-8'), os.O_TRUNC))
         print("   ✅ Changed login modal to signup modal")
-        print(f"   💾 Saved {filepath}")
     else:
         print("   ⚠️ Pattern not found (may already be patched or using different syntax)")
 
@@ -330,9 +479,8 @@ def patch_minifig_html():
     
     if old_pattern in content:
         content = content.replace(old_pattern, new_pattern)
-        filepath.write_text(content, encoding='utf-8')
+        pending_writes.append((filepath, content.encode('utf-8'), os.O_TRUNC))
         print("   ✅ Changed login modal to signup modal")
-        print(f"   💾 Saved {filepath}")
     else:
         print("   ⚠️ Pattern not found (may already be patched or using different syntax)")
 
@@ -351,24 +499,30 @@ def main():
     print()
     
     try:
-        patch_index_html()
-        print()
-        
-        patch_app_js()
-        print()
-        
-        patch_watches_ts()
-        print()
-        
-        patch_set_html()
-        print()
+        # The patches touch disjoint files, so run them concurrently; each
+        # one's output is buffered and printed in order once all are done
+        patches = [patch_index_html, patch_app_js, patch_watches_ts,
+                   patch_set_html, patch_minifig_html]
+        stdout = sys.stdout = _ThreadBufferedStdout(sys.stdout)
+        try:
+            with ThreadPoolExecutor(max_workers=len(patches)) as ex:
+                results = list(ex.map(stdout.run, patches))
+        finally:
+            sys.stdout = stdout.stream
+        for output, error in results:
+            sys.stdout.write(output)
+            if error is not None:
+                raise error
+            print()
         
-        patch_minifig_html()
-        print()
+        # Modified files are written together once every patch has run
+        if pending_writes:
+            flush_writes()
+            print()
         
     except Exception as e:
         print(f"❌ Error during patching: {e}")
-        print("   You may need to restore from backups (.bak.v29 files)")
+        print(f"   You may need to restore from backups ({BACKUP_SUFFIX} files)")
         return 1
     
     print("=" * 60)
@@ -388,14 +542,15 @@ def main():
     print("   - Watchlist: 'Change All...' dropdown in header")
     print("   - Set/Minifig pages: Click Watch while logged out → signup modal")
     print()
-    print("To rollback if needed:")
-    print("   cd /var/www/scoutloot/app")
-    print("   cp public/index.html.bak.v29 public/index.html")
-    print("   cp public/js/app.js.bak.v29 public/js/app.js")
-    print("   cp src/routes/watches.ts.bak.v29 src/routes/watches.ts")
-    print("   cp public/set.html.bak.v29 public/set.html")
-    print("   cp public/minifig.html.bak.v29 public/minifig.html")
-    print("   npm run build && pm2 restart scoutloot scoutloot-worker")
+    if created_backups:
+        print("To rollback if needed:")
+        print("   cd /var/www/scoutloot/app")
+        for rel in ('public/index.html', 'public/js/app.js', 'src/routes/watches.ts',
+                    'public/set.html', 'public/minifig.html'):
+            backup_path = created_backups.get(APP_DIR / rel)
+            if backup_path is not None:
+                print(f"   cp {backup_path.relative_to(APP_DIR)} {rel}")
+        print("   npm run build && pm2 restart scoutloot scoutloot-worker")
     
     return 0
 
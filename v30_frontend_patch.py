@@ -7,7 +7,7 @@ Changes:
 - minifig.html: Passes country to history API, uses returned symbol
 
 Usage:
-    scp v30_frontend_patch.py root@188.166.160.168:/var/www/scoutloot/app/
+    scp v30_frontend_patch.py patch_common.py root@188.166.160.168:/var/www/scoutloot/app/
     ssh root@188.166.160.168 "cd /var/www/scoutloot/app && python3 v30_frontend_patch.py"
 """
 
@@ -16,15 +16,47 @@ import shutil
 import re
 import sys
 
+from patch_common import map_file, patch_in_place, sendfile_copy
+
 BASE_DIR = '/var/www/scoutloot/app'
 
+# What verify_patches() checks for in each file; replace_all() reports them
+# from the same scan that applies the replacements
+SET_PROBES = ('currencySymbol', 'getCurrencySymbol', "return '€' + value;")
+MINIFIG_PROBES = ('getUserCountry', 'country=${getUserCountry()}', 'history.symbol', "return '€' + value;")
+
+def replace_all(filepath, replacements, probes=()):
+    """Apply all {old: new} replacements to filepath in a single scan.
+
+    The file is mapped and searched as bytes, and patch_in_place() rewrites
+    only the matched spans; there is no decode/encode round trip. Returns
+    the subset of probes present in the patched file, worked out from the
+    same scan (the probes are searched alongside the replacements).
+    """
+    replacements = {old.encode('utf-8'): new.encode('utf-8') for old, new in replacements.items()}
+    probes = {probe.encode('utf-8'): probe for probe in probes}
+    pattern = re.compile(b'|'.join(map(re.escape, {**probes, **replacements})))
+    with open(filepath, 'rb') as f, map_file(f) as mm:
+        matches = [(m.start(), m.group()) for m in pattern.finditer(mm)]
+    patch_in_place(filepath, [(start, len(old), replacements[old])
+                              for start, old in matches if old in replacements])
+    # Matched text that survives patching, plus the inserted replacements
+    kept = {old for _, old in matches if old not in replacements}
+    kept |= {replacements[old] for _, old in matches if old in replacements}
+    return {probe for needle, probe in probes.items() if any(needle in text for text in kept)}
+
+def copy_file(src, dst):
+    """shutil.copy() equivalent that copies the data with sendfile where available"""
+    if hasattr(os, 'sendfile'):
+        sendfile_copy(src, dst)
+        shutil.copymode(src, dst)
+    else:
+        shutil.copy(src, dst)
+
 def patch_set_html():
     """Patch set.html for regional currency support"""
     filepath = os.path.join(BASE_DIR, 'public/set.html')
     
-    with open(filepath, 'r') as f:
-        content = f.read()
-    
     # 1. Add currencySymbol and helper after "let priceChart = null;"
     helper_code = '''let priceChart = null;
     let currencySymbol = '€'; // V30: Dynamic currency symbol
@@ -45,33 +77,20 @@ def patch_set_html():
     }
     currencySymbol = getCurrencySymbol();'''
     
-    content = content.replace('let priceChart = null;', helper_code)
-    
-    # 2. Replace hardcoded € in tooltip callback
-    # Pattern: `${context.dataset.label}: €${context.raw.toFixed(2)}`
-    content = content.replace(
-        '${context.dataset.label}: €${context.raw.toFixed(2)}',
-        '${context.dataset.label}: ${currencySymbol}${context.raw.toFixed(2)}'
-    )
-    
-    # 3. Replace hardcoded € in Y-axis ticks
-    content = content.replace(
-        "return '€' + value;",
-        "return currencySymbol + value;"
-    )
-    
-    with open(filepath, 'w') as f:
-        f.write(content)
-    
-    return True
+    return replace_all(filepath, {
+        'let priceChart = null;': helper_code,
+        # 2. Replace hardcoded € in tooltip callback
+        # Pattern: `${context.dataset.label}: €${context.raw.toFixed(2)}`
+        '${context.dataset.label}: €${context.raw.toFixed(2)}':
+            '${context.dataset.label}: ${currencySymbol}${context.raw.toFixed(2)}',
+        # 3. Replace hardcoded € in Y-axis ticks
+        "return '€' + value;": "return currencySymbol + value;",
+    }, SET_PROBES)
 
 def patch_minifig_html():
     """Patch minifig.html for regional currency support"""
     filepath = os.path.join(BASE_DIR, 'public/minifig.html')
     
-    with open(filepath, 'r') as f:
-        content = f.read()
-    
     # 1. Add currencySymbol and helper after "let priceChart = null;"
     helper_code = '''let priceChart = null;
     let currencySymbol = '€'; // V30: Updated from API response
@@ -88,64 +107,41 @@ def patch_minifig_html():
       return 'US';
     }'''
     
-    content = content.replace('let priceChart = null;', helper_code)
-    
-    # 2. Update fetch URL to include country parameter
-    content = content.replace(
-        '/api/minifigs/${figNum}/history?days=${days}`',
-        '/api/minifigs/${figNum}/history?days=${days}&country=${getUserCountry()}`'
-    )
-    
-    # 3. Add symbol update after "const history = await response.json();"
-    content = content.replace(
-        'const history = await response.json();',
-        '''const history = await response.json();
-        currencySymbol = history.symbol || '€'; // V30: Use API symbol'''
-    )
-    
-    # 4. Replace hardcoded € in tooltip callback
-    content = content.replace(
-        '${context.dataset.label}: €${context.raw.y.toFixed(2)}',
-        '${context.dataset.label}: ${currencySymbol}${context.raw.y.toFixed(2)}'
-    )
-    
-    # 5. Replace hardcoded € in Y-axis ticks
-    content = content.replace(
-        "return '€' + value;",
-        "return currencySymbol + value;"
-    )
-    
-    with open(filepath, 'w') as f:
-        f.write(content)
-    
-    return True
+    return replace_all(filepath, {
+        'let priceChart = null;': helper_code,
+        # 2. Update fetch URL to include country parameter
+        '/api/minifigs/${figNum}/history?days=${days}`':
+            '/api/minifigs/${figNum}/history?days=${days}&country=${getUserCountry()}`',
+        # 3. Add symbol update after "const history = await response.json();"
+        'const history = await response.json();': '''const history = await response.json();
+        currencySymbol = history.symbol || '€'; // V30: Use API symbol''',
+        # 4. Replace hardcoded € in tooltip callback
+        '${context.dataset.label}: €${context.raw.y.toFixed(2)}':
+            '${context.dataset.label}: ${currencySymbol}${context.raw.y.toFixed(2)}',
+        # 5. Replace hardcoded € in Y-axis ticks
+        "return '€' + value;": "return currencySymbol + value;",
+    }, MINIFIG_PROBES)
 
-def verify_patches():
-    """Verify the patches were applied correctly"""
+def verify_patches(set_found, minifig_found):
+    """Verify the patches were applied correctly, given the probes found in each file"""
     errors = []
     
     # Check set.html
-    with open(os.path.join(BASE_DIR, 'public/set.html'), 'r') as f:
-        set_content = f.read()
-    
-    if 'currencySymbol' not in set_content:
+    if 'currencySymbol' not in set_found:
         errors.append('set.html: currencySymbol not found')
-    if 'getCurrencySymbol' not in set_content:
+    if 'getCurrencySymbol' not in set_found:
         errors.append('set.html: getCurrencySymbol function not found')
-    if "return '€' + value;" in set_content:
+    if "return '€' + value;" in set_found:
         errors.append('set.html: hardcoded € still in Y-axis')
     
     # Check minifig.html
-    with open(os.path.join(BASE_DIR, 'public/minifig.html'), 'r') as f:
-        minifig_content = f.read()
-    
-    if 'getUserCountry' not in minifig_content:
+    if 'getUserCountry' not in minifig_found:
         errors.append('minifig.html: getUserCountry function not found')
-    if 'country=${getUserCountry()}' not in minifig_content:
+    if 'country=${getUserCountry()}' not in minifig_found:
         errors.append('minifig.html: country parameter not in API call')
-    if 'history.symbol' not in minifig_content:
+    if 'history.symbol' not in minifig_found:
         errors.append('minifig.html: symbol from API not used')
-    if "return '€' + value;" in minifig_content:
+    if "return '€' + value;" in minifig_found:
         errors.append('minifig.html: hardcoded € still in Y-axis')
     
     return errors
@@ -162,11 +158,11 @@ def main():
     
     # Create backups
     print("[1/4] Creating backups...")
-    shutil.copy(
+    copy_file(
         os.path.join(BASE_DIR, 'public/set.html'),
         os.path.join(BASE_DIR, 'public/set.html.bak.v29')
     )
-    shutil.copy(
+    copy_file(
         os.path.join(BASE_DIR, 'public/minifig.html'),
         os.path.join(BASE_DIR, 'public/minifig.html.bak.v29')
     )
@@ -174,17 +170,17 @@ def main():
     
     # Patch set.html
     print("[2/4] Patching set.html...")
-    patch_set_html()
+    set_found = patch_set_html()
     print("  ✓ set.html patched")
     
     # Patch minifig.html
     print("[3/4] Patching minifig.html...")
-    patch_minifig_html()
+    minifig_found = patch_minifig_html()
     print("  ✓ minifig.html patched")
     
     # Verify
     print("[4/4] Verifying patches...")
-    errors = verify_patches()
+    errors = verify_patches(set_found, minifig_found)
     
     if errors:
         print()
@@ -193,11 +189,11 @@ def main():
             print(f"  ✗ {err}")
         print()
         print("Rolling back...")
-        shutil.copy(
+        copy_file(
             os.path.join(BASE_DIR, 'public/set.html.bak.v29'),
             os.path.join(BASE_DIR, 'public/set.html')
         )
-        shutil.copy(
+        copy_file(
             os.path.join(BASE_DIR, 'public/minifig.html.bak.v29'),
             os.path.join(BASE_DIR, 'public/minifig.html')
         )